@@ -0,0 +1,125 @@
+"""
+Memory benchmark for heading and TOC records
+Builds a synthetic book with 200k headings and measures the heap kept alive
+by extract_headings and build_nested_toc.
+
+"after" runs the real MarkdownConverter code path. "before" runs
+legacy_extract_headings / legacy_build_nested_toc below, a copy of the
+previous per-heading dict and (link, children) tuple implementation kept
+here only as the baseline.
+
+Run from the project root:
+    python benchmarks/heading_memory.py [heading_count]
+"""
+import os
+import re
+import sys
+import tracemalloc
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ebooklib import epub
+
+from converter import MarkdownConverter
+
+
+# One chapter with three sections of three subsections each
+LEVEL_PATTERN = [1] + [2, 3, 3, 3] * 3
+
+
+def synthetic_book(heading_count: int) -> str:
+    """Markdown with heading_count headings laid out like chapters and sections"""
+    lines = []
+    for idx in range(heading_count):
+        level = LEVEL_PATTERN[idx % len(LEVEL_PATTERN)]
+        lines.append(f"{'#' * level} Section {idx} with **some** text")
+        lines.append("")
+        lines.append("A short paragraph.")
+        lines.append("")
+    return '\n'.join(lines)
+
+
+def legacy_extract_headings(converter: MarkdownConverter, md_content: str):
+    """Previous extract_headings: one dict per heading"""
+    headings = []
+    for line in md_content.split('\n'):
+        match = re.match(r'^(#{1,6})\s+(.+)$', line.strip())
+        if match:
+            level = len(match.group(1))
+            text = match.group(2).strip()
+            text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)
+            text = re.sub(r'\*(.+?)\*', r'\1', text)
+            text = re.sub(r'`(.+?)`', r'\1', text)
+            text = re.sub(r'\[(.+?)\]\(.+?\)', r'\1', text)
+            headings.append({
+                'level': level,
+                'text': text,
+                'id': converter.generate_heading_id(text)
+            })
+    return headings
+
+
+def legacy_build_nested_toc(headings, chapter: epub.EpubHtml):
+    """Previous build_nested_toc: every heading below level 6 kept a (link, []) pair"""
+    toc_structure = []
+    stack = [(0, toc_structure)]
+    for heading in headings:
+        level = heading['level']
+        link = epub.Link(f"{chapter.file_name}#{heading['id']}", heading['text'], heading['id'])
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        if not stack:
+            stack = [(0, toc_structure)]
+        if level < 6:
+            children = []
+            stack[-1][1].append((link, children))
+            stack.append((level, children))
+        else:
+            stack[-1][1].append(link)
+    return toc_structure
+
+
+def measure(extract, build_toc, md_content, chapter):
+    """Return (bytes kept by the headings, bytes added by the TOC)"""
+    tracemalloc.start()
+    headings = extract(md_content)
+    headings_size = tracemalloc.get_traced_memory()[0]
+    toc = build_toc(headings, chapter)
+    toc_size = tracemalloc.get_traced_memory()[0] - headings_size
+    tracemalloc.stop()
+    del headings, toc
+    return headings_size, toc_size
+
+
+def main():
+    heading_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    md_content = synthetic_book(heading_count)
+
+    converter = MarkdownConverter()
+    chapter = converter.create_epub_chapter("Synthetic", "", "chapter_1.xhtml")
+
+    converter.heading_counter = 0
+    before = measure(
+        lambda md: legacy_extract_headings(converter, md),
+        legacy_build_nested_toc,
+        md_content,
+        chapter,
+    )
+
+    converter.heading_counter = 0
+    after = measure(converter.extract_headings, converter.build_nested_toc, md_content, chapter)
+
+    def row(label, before_size, after_size):
+        saved = (1 - after_size / before_size) * 100 if before_size else 0
+        print(f"{label:<18}{before_size / 2**20:>10.1f} MiB{after_size / 2**20:>10.1f} MiB{saved:>9.0f}%")
+
+    print(f"{heading_count:,} headings (text and ID strings included)")
+    print(f"{'':<18}{'before':>14}{'after':>14}{'saved':>10}")
+    row("Headings", before[0], after[0])
+    row("Nested TOC", before[1], after[1])
+    row("Total", sum(before), sum(after))
+
+
+if __name__ == "__main__":
+    main()
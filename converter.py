@@ -8,9 +8,59 @@ from ebooklib import epub
 from datetime import datetime
 from pathlib import Path
 import re
-from typing import List, Tuple, Dict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 from bs4 import BeautifulSoup
 import hashlib
+import html
+from verifier import check_epub, EpubVerificationError
+
+
+# Opening line of a fenced code block, as the fenced_code extension reads it:
+# the fence starts at column 0, followed by optional {attrs} or language/hl_lines
+FENCE_RE = re.compile(r'''^(`{3,}|~{3,})[ ]*(\{.*\}|\.?[\w#.+-]*[ ]*(hl_lines=(["']).*?\4[ ]*)?)$''')
+
+
+def update_fence(line: str, fence: Optional[str]) -> Optional[str]:
+    """
+    Track fenced code blocks line by line
+    Returns the marker of the fence still open after this line, or None.
+    A fence only closes on its exact opening marker plus trailing spaces.
+    """
+    if fence:
+        return None if line.rstrip() == fence else fence
+    match = FENCE_RE.match(line)
+    return match.group(1) if match else None
+
+
+@dataclass
+class Heading:
+    """A markdown heading: its level (1-6), plain text and generated anchor ID"""
+    # Explicit slots keep large books light: no per-heading __dict__
+    __slots__ = ('level', 'text', 'id')
+    level: int
+    text: str
+    id: str
+
+
+@dataclass
+class Chapter:
+    """A rendered chapter: XHTML content plus the headings used for its TOC"""
+    __slots__ = ('title', 'file_name', 'content', 'headings')
+    title: str
+    file_name: str
+    content: str
+    headings: List[Heading]
+
+    def to_epub_html(self) -> epub.EpubHtml:
+        """Create the ebooklib item for this chapter"""
+        chapter = epub.EpubHtml(
+            title=self.title,
+            file_name=self.file_name,
+            lang='en'
+        )
+        chapter.content = self.content
+        return chapter
 
 
 class MarkdownConverter:
@@ -25,6 +75,13 @@ class MarkdownConverter:
             'fenced_code'
         ])
         self.heading_counter = 0
+        # Prepended to generated heading IDs; distributed builds render chapters
+        # independently, so each chapter gets its own prefix to keep IDs unique
+        self.heading_prefix = ''
+        # Treat chapter links to missing files or anchors as verification errors
+        self.strict_links = False
+        # Non-fatal findings from the last verified build
+        self.verification_warnings = []
 
     def read_markdown_file(self, filepath: str) -> Tuple[str, str]:
         """Read markdown file and extract title"""
@@ -44,15 +101,22 @@ class MarkdownConverter:
         """Convert markdown content to HTML"""
         return self.md.convert(md_content)
 
-    def extract_headings(self, md_content: str) -> List[Dict]:
+    def extract_headings(self, md_content: str) -> List[Heading]:
         """
         Extract headings from markdown content with their levels
-        Returns list of dicts: [{'level': 1, 'text': 'Title', 'id': 'title'}, ...]
+        Returns list of Heading records: [Heading(level=1, text='Title', id='title-1'), ...]
         """
         headings = []
         lines = md_content.split('\n')
+        fence = None
 
         for line in lines:
+            # Skip fenced code blocks, where '#' starts a comment, not a heading
+            in_code = fence is not None
+            fence = update_fence(line, fence)
+            if in_code or fence:
+                continue
+
             # Match ATX-style headings (# Heading)
             match = re.match(r'^(#{1,6})\s+(.+)$', line.strip())
             if match:
@@ -67,11 +131,7 @@ class MarkdownConverter:
                 # Generate a unique ID for this heading
                 heading_id = self.generate_heading_id(text)
 
-                headings.append({
-                    'level': level,
-                    'text': text,
-                    'id': heading_id
-                })
+                headings.append(Heading(level, text, heading_id))
 
         return headings
 
@@ -83,11 +143,11 @@ class MarkdownConverter:
 
         # Add counter to ensure uniqueness
         self.heading_counter += 1
-        heading_id = f"{heading_id}-{self.heading_counter}"
+        heading_id = f"{self.heading_prefix}{heading_id}-{self.heading_counter}"
 
         return heading_id
 
-    def add_ids_to_html_headings(self, html_content: str, headings: List[Dict]) -> str:
+    def add_ids_to_html_headings(self, html_content: str, headings: List[Heading]) -> str:
         """Add ID attributes to HTML headings for navigation"""
         soup = BeautifulSoup(html_content, 'html.parser')
 
@@ -99,12 +159,12 @@ class MarkdownConverter:
         for tag in all_headings:
             if heading_idx < len(headings):
                 # Add ID attribute
-                tag['id'] = headings[heading_idx]['id']
+                tag['id'] = headings[heading_idx].id
                 heading_idx += 1
 
         return str(soup)
 
-    def build_nested_toc(self, headings: List[Dict], chapter: epub.EpubHtml) -> List:
+    def build_nested_toc(self, headings: List[Heading], chapter: epub.EpubHtml) -> List:
         """
         Build a nested table of contents structure from headings
         Returns a nested list/tuple structure suitable for epub.toc
@@ -116,13 +176,13 @@ class MarkdownConverter:
         stack = [(0, toc_structure)]  # (level, current_list)
 
         for heading in headings:
-            level = heading['level']
+            level = heading.level
 
             # Create link object
             link = epub.Link(
-                f"{chapter.file_name}#{heading['id']}",
-                heading['text'],
-                heading['id']
+                f"{chapter.file_name}#{heading.id}",
+                heading.text,
+                heading.id
             )
 
             # Find the appropriate parent level
@@ -142,17 +202,34 @@ class MarkdownConverter:
             else:
                 current_list.append(link)
 
+        self._collapse_toc_leaves(toc_structure)
+
         return toc_structure
 
+    def _collapse_toc_leaves(self, entries: List):
+        """Replace (link, []) entries that never got children with the bare link"""
+        for idx, entry in enumerate(entries):
+            if isinstance(entry, tuple):
+                link, children = entry
+                if children:
+                    self._collapse_toc_leaves(children)
+                else:
+                    # Saves a tuple and a list per heading and avoids empty <ol/> in the nav
+                    entries[idx] = link
+
     def create_epub_chapter(self, title: str, content: str, filename: str,
-                          headings: List[Dict] = None) -> epub.EpubHtml:
+                          headings: List[Heading] = None) -> epub.EpubHtml:
         """Create an EPUB chapter from HTML content with proper heading IDs"""
-        chapter = epub.EpubHtml(
-            title=title,
-            file_name=filename,
-            lang='en'
-        )
-
+        return Chapter(
+            title,
+            filename,
+            self.build_chapter_content(title, content, headings),
+            headings or []
+        ).to_epub_html()
+
+    def build_chapter_content(self, title: str, content: str,
+                              headings: List[Heading] = None) -> str:
+        """Wrap chapter HTML in a styled document with proper heading IDs"""
         # Add IDs to headings if provided
         if headings:
             content = self.add_ids_to_html_headings(content, headings)
@@ -216,10 +293,10 @@ class MarkdownConverter:
         }
         """
 
-        chapter.content = f"""
+        return f"""
         <html>
         <head>
-            <title>{title}</title>
+            <title>{html.escape(title)}</title>
             <style>{css}</style>
         </head>
         <body>
@@ -228,10 +305,36 @@ class MarkdownConverter:
         </html>
         """
 
-        return chapter
+    def write_epub(self, book: epub.EpubBook, output_file: str, verify: bool = True):
+        """
+        Write an EPUB file, verifying it first when requested
+        The book is written to a temporary file and only moved to output_file
+        once it passes, so a failed build never replaces an existing book.
+        Raises EpubVerificationError; warnings are kept in verification_warnings.
+        """
+        self.verification_warnings = []
+        if not verify:
+            epub.write_epub(output_file, book)
+            return
+
+        tmp_file = f"{output_file}.partial"
+        try:
+            epub.write_epub(tmp_file, book)
+            problems, warnings = check_epub(tmp_file)
+            if self.strict_links:
+                problems, warnings = problems + warnings, []
+            if problems:
+                raise EpubVerificationError(output_file, problems)
+            os.replace(tmp_file, output_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+        self.verification_warnings = warnings
 
     def convert_single_file(self, input_file: str, output_file: str,
-                          book_title: str = None, author: str = "Unknown") -> bool:
+                          book_title: str = None, author: str = "Unknown",
+                          verify: bool = True) -> bool:
         """Convert a single markdown file to EPUB with hierarchical TOC"""
         try:
             # Reset heading counter for new conversion
@@ -277,81 +380,96 @@ class MarkdownConverter:
             book.spine = ['nav', chapter]
 
             # Write EPUB file
-            epub.write_epub(output_file, book)
+            self.write_epub(book, output_file, verify)
 
             return True
 
+        except EpubVerificationError:
+            raise
         except Exception as e:
             raise Exception(f"Error converting file: {str(e)}")
 
     def convert_multiple_files(self, input_files: List[str], output_file: str,
-                              book_title: str = "Compiled Book", author: str = "Unknown") -> bool:
+                              book_title: str = "Compiled Book", author: str = "Unknown",
+                              verify: bool = True) -> bool:
         """Convert multiple markdown files into a single EPUB with hierarchical TOC"""
         try:
             # Reset heading counter for new conversion
             self.heading_counter = 0
 
-            # Create EPUB book
-            book = epub.EpubBook()
+            chapters = [
+                self.render_chapter(input_file, f'chapter_{idx}.xhtml')
+                for idx, input_file in enumerate(input_files, 1)
+            ]
 
-            # Set metadata
-            book.set_identifier(f'md2epub_{datetime.now().timestamp()}')
-            book.set_title(book_title)
-            book.set_language('en')
-            book.add_author(author)
+            self.write_book(chapters, output_file, book_title, author, verify)
 
-            chapters = []
-            toc = []
-
-            # Process each markdown file
-            for idx, input_file in enumerate(input_files, 1):
-                md_content, chapter_title = self.read_markdown_file(input_file)
-
-                # Extract headings for this chapter
-                headings = self.extract_headings(md_content)
-
-                # Convert to HTML
-                html_content = self.markdown_to_html(md_content)
-
-                # Create chapter with heading IDs
-                chapter = self.create_epub_chapter(
-                    chapter_title,
-                    html_content,
-                    f'chapter_{idx}.xhtml',
-                    headings
-                )
-
-                book.add_item(chapter)
-                chapters.append(chapter)
-
-                # Build TOC for this chapter
-                if headings:
-                    # Create a section with chapter title and nested headings
-                    chapter_toc = self.build_nested_toc(headings, chapter)
-                    # Add chapter as main entry with its sub-headings
-                    toc.append((
-                        epub.Section(chapter_title),
-                        chapter_toc
-                    ))
-                else:
-                    # Just add the chapter as a simple entry
-                    toc.append(chapter)
+            return True
 
-            # Add navigation
-            book.toc = tuple(toc)
-            book.add_item(epub.EpubNcx())
-            book.add_item(epub.EpubNav())
+        except EpubVerificationError:
+            raise
+        except Exception as e:
+            raise Exception(f"Error converting files: {str(e)}")
 
-            # Define spine
-            book.spine = ['nav'] + chapters
+    def render_chapter(self, input_file: str, filename: str) -> Chapter:
+        """Read a markdown file and render it into a chapter record with its headings"""
+        md_content, chapter_title = self.read_markdown_file(input_file)
 
-            # Write EPUB file
-            epub.write_epub(output_file, book)
+        # Extract headings for this chapter
+        headings = self.extract_headings(md_content)
 
-            return True
+        # Convert to HTML
+        html_content = self.markdown_to_html(md_content)
 
-        except Exception as e:
-            raise Exception(f"Error converting files: {str(e)}")
+        # Create chapter with heading IDs
+        content = self.build_chapter_content(chapter_title, html_content, headings)
+
+        return Chapter(chapter_title, filename, content, headings)
+
+    def write_book(self, chapters: List[Chapter], output_file: str,
+                   book_title: str = "Compiled Book", author: str = "Unknown",
+                   verify: bool = True):
+        """Assemble rendered chapters into a single EPUB with hierarchical TOC"""
+        # Create EPUB book
+        book = epub.EpubBook()
+
+        # Set metadata
+        book.set_identifier(f'md2epub_{datetime.now().timestamp()}')
+        book.set_title(book_title)
+        book.set_language('en')
+        book.add_author(author)
+
+        toc = []
+        items = []
+
+        for record in chapters:
+            chapter = record.to_epub_html()
+            book.add_item(chapter)
+            items.append(chapter)
+
+            # Build TOC for this chapter
+            if record.headings:
+                # Create a section with chapter title and nested headings
+                chapter_toc = self.build_nested_toc(record.headings, chapter)
+                # Add chapter as main entry with its sub-headings
+                toc.append((
+                    epub.Section(chapter.title, chapter.file_name),
+                    chapter_toc
+                ))
+            else:
+                # Just add the chapter as a simple entry
+                toc.append(chapter)
+
+        # Add navigation
+        book.toc = tuple(toc)
+        book.add_item(epub.EpubNcx())
+        book.add_item(epub.EpubNav())
+
+        # Define spine
+        book.spine = ['nav'] + items
+
+        # Write EPUB file
+        self.write_epub(book, output_file, verify)
 
     def convert_to_mobi(self, epub_file: str, mobi_file: str) -> Tuple[bool, str]:
         """
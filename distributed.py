@@ -0,0 +1,602 @@
+"""
+Distributed book builds for the Markdown to EPUB converter
+Shards chapter rendering and whole-book jobs across worker nodes that share
+a build directory (e.g. an NFS/SMB mount). Rendered chapters and finished
+EPUBs are published to a content-addressed store inside that directory.
+
+Layout of the shared build directory:
+
+    objects/ab/cdef...        content-addressed artifacts (sha256)
+    queue/shard-NN/JOB.json   pending jobs, sharded for work-stealing
+    claimed/JOB@WORKER.json   jobs being worked on; mtime is the lease heartbeat
+    done/JOB.json             completed jobs with the digest of their result
+    failed/JOB.json           jobs that ran out of attempts
+    books/BOOK.json           book specs, BOOK.lock / BOOK.result.json on finish
+
+All coordination relies on atomic rename and O_EXCL file creation, so no
+server process is needed: any number of workers on any number of hosts can
+join or leave at any time.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from converter import Chapter, Heading, MarkdownConverter
+
+
+DEFAULT_SHARDS = 8
+DEFAULT_LEASE_TIMEOUT = 30.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def _write_atomic(path: Path, data: bytes):
+    """Write a file so readers on other nodes never see it half-written"""
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _write_json(path: Path, data: Dict):
+    _write_atomic(path, json.dumps(data).encode('utf-8'))
+
+
+def _read_json(path: Path) -> Dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class ArtifactStore:
+    """Content-addressed artifact store on a shared filesystem path"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:]
+
+    def put(self, data: bytes) -> str:
+        """Store data and return its sha256 digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            _write_atomic(path, data)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        """Return the data stored under digest"""
+        with open(self._path(digest), 'rb') as f:
+            return f.read()
+
+    def has(self, digest: str) -> bool:
+        return self._path(digest).exists()
+
+    def put_json(self, data: Dict) -> str:
+        return self.put(json.dumps(data, sort_keys=True).encode('utf-8'))
+
+    def get_json(self, digest: str) -> Dict:
+        return json.loads(self.get(digest).decode('utf-8'))
+
+
+class BuildDirectory:
+    """Shared build directory holding the artifact store and the job queues"""
+
+    def __init__(self, root: str, shards: int = DEFAULT_SHARDS):
+        self.root = Path(root)
+        self.queue_dir = self.root / 'queue'
+        self.claimed_dir = self.root / 'claimed'
+        self.done_dir = self.root / 'done'
+        self.failed_dir = self.root / 'failed'
+        self.books_dir = self.root / 'books'
+        self.store = ArtifactStore(self.root / 'objects')
+
+        for directory in (self.claimed_dir, self.done_dir, self.failed_dir, self.books_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+        for shard in range(shards):
+            (self.queue_dir / f'shard-{shard:02d}').mkdir(parents=True, exist_ok=True)
+
+    def shards(self) -> List[Path]:
+        return sorted(p for p in self.queue_dir.iterdir() if p.is_dir())
+
+    def enqueue(self, job: Dict, shard: Optional[int] = None):
+        """Place a job in a queue shard (round-robin by job number if not given)"""
+        shards = self.shards()
+        if shard is None:
+            shard = job.get('index', 0)
+        _write_json(shards[shard % len(shards)] / f"{job['id']}.json", job)
+
+    def claims(self) -> List[Path]:
+        return [p for p in self.claimed_dir.iterdir() if p.suffix == '.json' and not p.name.startswith('.')]
+
+    def reap_expired(self, lease_timeout: float) -> int:
+        """
+        Requeue jobs whose worker stopped heartbeating
+        Returns the number of jobs reclaimed
+        """
+        reaped = 0
+        now = time.time()
+        for claim in self.claims():
+            try:
+                if now - claim.stat().st_mtime < lease_timeout:
+                    continue
+                # Win the race against other reapers and the (possibly alive) owner
+                tmp = claim.with_name(f".{claim.name}.{uuid.uuid4().hex}.reap")
+                os.rename(claim, tmp)
+            except FileNotFoundError:
+                continue
+
+            job = _read_json(tmp)
+            job['attempts'] = job.get('attempts', 0) + 1
+            job['last_error'] = f"lease expired on worker {claim.stem.split('@', 1)[-1]}"
+            self.retry_or_fail(job)
+            tmp.unlink()
+            reaped += 1
+        return reaped
+
+    def retry_or_fail(self, job: Dict):
+        """Requeue a job after a failed attempt, or fail its book once out of attempts"""
+        if job['attempts'] >= job.get('max_attempts', DEFAULT_MAX_ATTEMPTS):
+            _write_json(self.failed_dir / f"{job['id']}.json", job)
+            self.fail_book(job['book'], job)
+        else:
+            self.enqueue(job)
+
+    def book_spec(self, book_id: str) -> Dict:
+        return _read_json(self.books_dir / f"{book_id}.json")
+
+    def book_result(self, book_id: str) -> Optional[Dict]:
+        path = self.books_dir / f"{book_id}.result.json"
+        return _read_json(path) if path.exists() else None
+
+    def lock_book(self, book_id: str) -> bool:
+        """Try to become the node that finalises a book; only one caller wins"""
+        try:
+            fd = os.open(self.books_dir / f"{book_id}.lock", os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        return True
+
+    def record_result(self, book_id: str, result: Dict) -> bool:
+        """
+        Record a book's terminal result unless it already has one
+        The result is linked into place, so the first result written wins
+        and readers never see it half-written. Returns whether it was recorded.
+        """
+        path = self.books_dir / f"{book_id}.result.json"
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(result).encode('utf-8'))
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            return False
+        finally:
+            tmp.unlink()
+        return True
+
+    def fail_book(self, book_id: str, failed_job: Dict):
+        """Record a failed book unless it already has a result"""
+        self.record_result(book_id, {
+            'status': 'failed',
+            'error': f"job {failed_job['id']} failed: {failed_job.get('last_error')}",
+        })
+
+
+class Coordinator:
+    """Submit books to a shared build directory and wait for them to finish"""
+
+    def __init__(self, root: str, shards: int = DEFAULT_SHARDS,
+                 lease_timeout: float = DEFAULT_LEASE_TIMEOUT,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.build_dir = BuildDirectory(root, shards)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+
+    def submit(self, input_files: List[str], output_file: str,
+               book_title: str = "Compiled Book", author: str = "Unknown") -> str:
+        """
+        Queue a book for building and return its book ID
+        A single input file becomes one whole-book job; several input files
+        are split into one chapter job each and assembled by the last finisher.
+        """
+        book_id = uuid.uuid4().hex[:12]
+        input_files = [os.path.abspath(f) for f in input_files]
+        output_file = os.path.abspath(output_file)
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+        if len(input_files) == 1:
+            jobs = [{
+                'id': f'{book_id}-book',
+                'type': 'book',
+                'input_file': input_files[0],
+            }]
+        else:
+            jobs = [{
+                'id': f'{book_id}-c{idx:05d}',
+                'type': 'chapter',
+                'index': idx,
+                'input_file': input_file,
+            } for idx, input_file in enumerate(input_files, 1)]
+
+        _write_json(self.build_dir.books_dir / f'{book_id}.json', {
+            'id': book_id,
+            'title': book_title,
+            'author': author,
+            'output_file': output_file,
+            'jobs': [job['id'] for job in jobs],
+        })
+
+        for job in jobs:
+            job.update(book=book_id, attempts=0, max_attempts=self.max_attempts)
+            self.build_dir.enqueue(job)
+
+        return book_id
+
+    def wait(self, book_ids: List[str], timeout: float = None, poll_interval: float = 0.5) -> Dict[str, Dict]:
+        """
+        Wait until every book has a result, reaping lost workers meanwhile
+        Returns {book_id: result}
+        """
+        deadline = time.time() + timeout if timeout else None
+        results = {}
+        while True:
+            for book_id in book_ids:
+                if book_id not in results:
+                    result = self.build_dir.book_result(book_id)
+                    if result:
+                        results[book_id] = result
+            if len(results) == len(book_ids):
+                return results
+            if deadline and time.time() > deadline:
+                raise TimeoutError(f"{len(book_ids) - len(results)} books still building")
+
+            self.build_dir.reap_expired(self.lease_timeout)
+            time.sleep(poll_interval)
+
+
+class Worker:
+    """Claim jobs from the shared build directory and run them"""
+
+    def __init__(self, root: str, worker_id: str = None,
+                 lease_timeout: float = DEFAULT_LEASE_TIMEOUT,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.build_dir = BuildDirectory(root)
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.converter = MarkdownConverter()
+
+        shards = self.build_dir.shards()
+        digest = hashlib.sha256(self.worker_id.encode('utf-8')).digest()
+        self.home_shard = shards[int.from_bytes(digest[:4], 'big') % len(shards)]
+
+        self._claim_path = None
+        self._claim_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _heartbeat(self):
+        """Keep the lease on the current claim alive while the job runs"""
+        while not self._stop.wait(self.lease_timeout / 3):
+            with self._claim_lock:
+                if self._claim_path:
+                    try:
+                        os.utime(self._claim_path)
+                    except FileNotFoundError:
+                        # The job was reaped and will run again elsewhere;
+                        # jobs are idempotent, so finishing it here is harmless
+                        self._claim_path = None
+
+    def _candidate_shards(self) -> List[Path]:
+        """Home shard first, then the fullest shards to steal from"""
+        others = [s for s in self.build_dir.shards() if s != self.home_shard]
+        others.sort(key=lambda s: len(os.listdir(s)), reverse=True)
+        return [self.home_shard] + others
+
+    def claim(self) -> Optional[Path]:
+        """Atomically take the next pending job, stealing from other shards if idle"""
+        for shard in self._candidate_shards():
+            for entry in sorted(os.listdir(shard)):
+                if entry.startswith('.') or not entry.endswith('.json'):
+                    continue
+                claim = self.build_dir.claimed_dir / f'{entry[:-5]}@{self.worker_id}.json'
+                try:
+                    os.rename(shard / entry, claim)
+                except FileNotFoundError:
+                    # Another worker got there first
+                    continue
+                try:
+                    os.utime(claim)
+                except FileNotFoundError:
+                    # Reaped straight away because the job sat in the queue
+                    # for longer than the lease timeout; it has been requeued
+                    continue
+                return claim
+        return None
+
+    def _release(self, claim: Path) -> bool:
+        """Give up the claim; returns False if the job was reaped in the meantime"""
+        with self._claim_lock:
+            self._claim_path = None
+            try:
+                claim.unlink()
+            except FileNotFoundError:
+                return False
+            return True
+
+    def run_job(self, claim: Path):
+        """
+        Run one claimed job and publish its result
+        Everything the job produces is written while the claim is still held,
+        so a node dying at any point leaves a claim behind that gets reaped
+        and retried. Jobs are idempotent, so a retry after a late finish is harmless.
+        """
+        job = _read_json(claim)
+        with self._claim_lock:
+            self._claim_path = claim
+
+        follow_up = None
+        try:
+            done_path = self.build_dir.done_dir / f"{job['id']}.json"
+            # A previous owner may have finished the job but died before releasing it
+            if not done_path.exists():
+                if job['type'] == 'chapter':
+                    result = self._render_chapter(job)
+                elif job['type'] == 'book':
+                    result = self._build_single_book(job)
+                elif job['type'] == 'assemble':
+                    result = self._assemble_book(job)
+                else:
+                    raise ValueError(f"Unknown job type: {job['type']}")
+
+                if job['type'] in ('book', 'assemble'):
+                    self._publish_book(job['book'], result)
+
+                _write_json(done_path, {
+                    'id': job['id'],
+                    'worker': self.worker_id,
+                    'result': result,
+                })
+
+            if job['type'] == 'chapter':
+                follow_up = self._claim_assembly(job['book'])
+        except Exception:
+            if self._release(claim):
+                job['attempts'] = job.get('attempts', 0) + 1
+                job['last_error'] = traceback.format_exc(limit=3)
+                self.build_dir.retry_or_fail(job)
+            return
+
+        self._release(claim)
+
+        if follow_up:
+            self.run_job(follow_up)
+
+    def _render_chapter(self, job: Dict) -> str:
+        # Chapters are rendered independently, so heading IDs get a
+        # per-chapter prefix instead of relying on a book-wide counter
+        self.converter.heading_counter = 0
+        self.converter.heading_prefix = f"c{job['index']}-"
+        try:
+            chapter = self.converter.render_chapter(
+                job['input_file'], f"chapter_{job['index']}.xhtml"
+            )
+        finally:
+            self.converter.heading_prefix = ''
+
+        return self.build_dir.store.put_json({
+            'title': chapter.title,
+            'file_name': chapter.file_name,
+            'content': chapter.content,
+            'headings': [[h.level, h.text, h.id] for h in chapter.headings],
+        })
+
+    def _build_single_book(self, job: Dict) -> str:
+        spec = self.build_dir.book_spec(job['book'])
+        tmp_output = self._tmp_output(spec)
+        self.converter.convert_single_file(job['input_file'], tmp_output, spec['title'], spec['author'])
+        return self._store_book(tmp_output)
+
+    def _assemble_book(self, job: Dict) -> str:
+        spec = self.build_dir.book_spec(job['book'])
+        chapters = []
+        for job_id in spec['jobs']:
+            done = _read_json(self.build_dir.done_dir / f'{job_id}.json')
+            rendered = self.build_dir.store.get_json(done['result'])
+            chapters.append(Chapter(
+                rendered['title'],
+                rendered['file_name'],
+                rendered['content'],
+                [Heading(*h) for h in rendered['headings']],
+            ))
+
+        tmp_output = self._tmp_output(spec)
+        self.converter.write_book(chapters, tmp_output, spec['title'], spec['author'])
+        return self._store_book(tmp_output)
+
+    def _tmp_output(self, spec: Dict) -> str:
+        return str(self.build_dir.books_dir / f".{spec['id']}.{self.worker_id}.epub")
+
+    def _store_book(self, tmp_output: str) -> str:
+        """Move a finished EPUB into the artifact store and return its digest"""
+        with open(tmp_output, 'rb') as f:
+            data = f.read()
+        os.remove(tmp_output)
+        return self.build_dir.store.put(data)
+
+    def _publish_book(self, book_id: str, digest: str):
+        """Copy a stored EPUB to the book's output path and record the result"""
+        spec = self.build_dir.book_spec(book_id)
+        _write_atomic(Path(spec['output_file']), self.build_dir.store.get(digest))
+        self.build_dir.record_result(book_id, {
+            'status': 'success',
+            'digest': digest,
+            'output_file': spec['output_file'],
+            'worker': self.worker_id,
+        })
+
+    def _claim_assembly(self, book_id: str) -> Optional[Path]:
+        """
+        If every chapter of the book is done, claim its assembly job
+        Returns the claim for the first node to notice, None for everyone else
+        """
+        spec = self.build_dir.book_spec(book_id)
+        if not all((self.build_dir.done_dir / f'{job_id}.json').exists() for job_id in spec['jobs']):
+            return None
+
+        # Write the claim before taking the lock, so the assembly stays
+        # recoverable by other workers if this node dies at any point
+        job = {
+            'id': f'{book_id}-assemble',
+            'type': 'assemble',
+            'book': book_id,
+            'attempts': 0,
+            'max_attempts': self.max_attempts,
+        }
+        claim = self.build_dir.claimed_dir / f"{job['id']}@{self.worker_id}.json"
+        _write_json(claim, job)
+
+        if not self.build_dir.lock_book(book_id):
+            claim.unlink()
+            return None
+        return claim
+
+    def run(self, until_idle: bool = False, poll_interval: float = 0.5):
+        """
+        Process jobs until stopped
+        With until_idle, return once the queue is empty and nothing is claimed.
+        """
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        try:
+            while True:
+                claim = self.claim()
+                if claim:
+                    self.run_job(claim)
+                    continue
+
+                self.build_dir.reap_expired(self.lease_timeout)
+                if until_idle and not self.build_dir.claims() and not self._has_pending():
+                    return
+                time.sleep(poll_interval)
+        finally:
+            self._stop.set()
+
+    def _has_pending(self) -> bool:
+        return any(
+            not name.startswith('.')
+            for shard in self.build_dir.shards()
+            for name in os.listdir(shard)
+        )
+
+
+def _run_worker(root: str, worker_id: str, lease_timeout: float):
+    Worker(root, worker_id, lease_timeout=lease_timeout).run()
+
+
+def build_locally(books: List[Dict], root: str, workers: int = 4,
+                  lease_timeout: float = DEFAULT_LEASE_TIMEOUT,
+                  timeout: float = None) -> Dict[str, Dict]:
+    """
+    Build books with several local worker processes standing in for nodes
+    Each book is a dict with input_files, output_file and optional title/author.
+    Returns {book_id: result}
+    """
+    coordinator = Coordinator(root, lease_timeout=lease_timeout)
+    book_ids = [
+        coordinator.submit(
+            book['input_files'],
+            book['output_file'],
+            book.get('title', "Compiled Book"),
+            book.get('author', "Unknown"),
+        )
+        for book in books
+    ]
+
+    processes = [
+        multiprocessing.Process(
+            target=_run_worker,
+            args=(root, f'local-{idx}', lease_timeout),
+            daemon=True,
+        )
+        for idx in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        return coordinator.wait(book_ids, timeout)
+    finally:
+        # Workers keep polling for jobs, so stop them once every book is done
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+def main():
+    """Command line entry point for coordinator and worker nodes"""
+    parser = argparse.ArgumentParser(description="Distributed markdown to EPUB builds")
+    parser.add_argument('--root', required=True, help="Shared build directory")
+    parser.add_argument('--lease-timeout', type=float, default=DEFAULT_LEASE_TIMEOUT)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    submit_parser = subparsers.add_parser('submit', help="Queue books from a JSON file and wait")
+    submit_parser.add_argument('books', help="JSON list of {input_files, output_file, title, author}")
+    submit_parser.add_argument('--no-wait', action='store_true')
+
+    worker_parser = subparsers.add_parser('worker', help="Run a worker node")
+    worker_parser.add_argument('--id', help="Worker ID (defaults to host-pid)")
+    worker_parser.add_argument('--until-idle', action='store_true')
+
+    local_parser = subparsers.add_parser('local', help="Build with local worker processes")
+    local_parser.add_argument('books', help="JSON list of {input_files, output_file, title, author}")
+    local_parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        Worker(args.root, args.id, lease_timeout=args.lease_timeout).run(until_idle=args.until_idle)
+        return
+
+    with open(args.books, 'r', encoding='utf-8') as f:
+        books = json.load(f)
+
+    if args.command == 'local':
+        results = build_locally(books, args.root, args.workers, args.lease_timeout)
+    else:
+        coordinator = Coordinator(args.root, lease_timeout=args.lease_timeout)
+        book_ids = [
+            coordinator.submit(
+                book['input_files'],
+                book['output_file'],
+                book.get('title', "Compiled Book"),
+                book.get('author', "Unknown"),
+            )
+            for book in books
+        ]
+        if args.no_wait:
+            print('\n'.join(book_ids))
+            return
+        results = coordinator.wait(book_ids)
+
+    for book_id, result in results.items():
+        if result['status'] == 'success':
+            print(f"{book_id}: {result['output_file']}")
+        else:
+            print(f"{book_id}: FAILED - {result['error']}")
+
+
+if __name__ == "__main__":
+    main()
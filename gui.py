@@ -6,7 +6,9 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
 from pathlib import Path
 import threading
+import time
 from converter import MarkdownConverter
+from preview import IncrementalRenderer, html_to_segments
 
 
 class ConverterGUI:
@@ -67,6 +69,12 @@ class ConverterGUI:
             command=self.clear_selection
         ).grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
 
+        ttk.Button(
+            file_frame,
+            text="Preview",
+            command=self.open_preview
+        ).grid(row=3, column=0, padx=5, pady=5, sticky=tk.W)
+
         # Selected files display
         self.files_text = scrolledtext.ScrolledText(
             file_frame,
@@ -75,7 +83,7 @@ class ConverterGUI:
             wrap=tk.WORD,
             state='disabled'
         )
-        self.files_text.grid(row=0, column=1, rowspan=3, padx=5, pady=5, sticky=(tk.W, tk.E))
+        self.files_text.grid(row=0, column=1, rowspan=4, padx=5, pady=5, sticky=(tk.W, tk.E))
 
         # Output settings section
         output_frame = ttk.LabelFrame(main_frame, text="Output Settings", padding="10")
@@ -229,6 +237,15 @@ class ConverterGUI:
 
         self.files_text.config(state='disabled')
 
+    def open_preview(self):
+        """Open a live preview of the first selected file"""
+        if not self.selected_files:
+            messagebox.showerror("Error", "Please select a markdown file to preview")
+            return
+
+        PreviewWindow(self.root, self.selected_files[0])
+        self.log_message(f"Previewing: {self.selected_files[0]}", "info")
+
     def select_output_directory(self):
         """Select output directory"""
         directory = filedialog.askdirectory(title="Select Output Directory")
@@ -298,7 +315,9 @@ class ConverterGUI:
                     author
                 )
 
-            self.log_message(f"EPUB created: {epub_path}", "success")
+            self.log_message(f"EPUB created and verified: {epub_path}", "success")
+            for warning in self.converter.verification_warnings:
+                self.log_message(f"Verification warning: {warning}", "info")
 
             # Convert to MOBI if requested
             if output_format in ["mobi", "both"]:
@@ -332,6 +351,114 @@ class ConverterGUI:
             self.root.after(0, self.progress.stop)
 
 
+class PreviewWindow:
+    """Live preview of a markdown file that re-renders only the edited blocks"""
+
+    POLL_INTERVAL = 300  # ms
+
+    def __init__(self, parent, filepath):
+        self.filepath = filepath
+        self.renderer = IncrementalRenderer()
+        self.block_marks = []
+        self.mark_counter = 0
+        self.last_stat = None
+        self.poll_id = None
+
+        self.window = tk.Toplevel(parent)
+        self.window.title(f"Preview - {Path(filepath).name}")
+        self.window.geometry("700x800")
+        self.window.columnconfigure(0, weight=1)
+        self.window.rowconfigure(0, weight=1)
+
+        self.preview_text = scrolledtext.ScrolledText(
+            self.window,
+            wrap=tk.WORD,
+            padx=10,
+            pady=10,
+            font=('Georgia', 11),
+            state='disabled'
+        )
+        self.preview_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+        self.status_var = tk.StringVar(value="Loading...")
+        ttk.Label(self.window, textvariable=self.status_var).grid(row=1, column=0, sticky=tk.W, padx=5)
+
+        # Configure text tags matching the EPUB stylesheet
+        for level, size in enumerate((20, 17, 15, 13, 12, 11), 1):
+            self.preview_text.tag_config(f"h{level}", font=('Arial', size, 'bold'), foreground="#333")
+        self.preview_text.tag_config("bold", font=('Georgia', 11, 'bold'))
+        self.preview_text.tag_config("italic", font=('Georgia', 11, 'italic'))
+        self.preview_text.tag_config("code", font=('Courier New', 10), background="#f4f4f4")
+        self.preview_text.tag_config("pre", font=('Courier New', 10), background="#f4f4f4")
+        self.preview_text.tag_config("quote", foreground="#666", lmargin1=20, lmargin2=20)
+        self.preview_text.tag_config("link", foreground="blue", underline=True)
+
+        # Closing the window (or the main window) must cancel the pending poll
+        self.window.bind("<Destroy>", self.on_destroy)
+
+        self.poll_file()
+
+    def on_destroy(self, event):
+        """Stop polling once the preview window is destroyed"""
+        # Child widgets report their own <Destroy> through the toplevel binding
+        if event.widget is self.window and self.poll_id is not None:
+            self.window.after_cancel(self.poll_id)
+            self.poll_id = None
+
+    def poll_file(self):
+        """Refresh the preview whenever the file changes on disk"""
+        try:
+            stat = os.stat(self.filepath)
+            current = (stat.st_mtime_ns, stat.st_size)
+            if current != self.last_stat:
+                self.last_stat = current
+                with open(self.filepath, 'r', encoding='utf-8') as f:
+                    self.refresh(f.read())
+        except (OSError, UnicodeDecodeError) as e:
+            self.status_var.set(f"Cannot read file: {e}")
+        except Exception as e:
+            self.status_var.set(f"Preview failed: {e}")
+        finally:
+            # Keep polling so the preview recovers on the next save
+            self.poll_id = self.window.after(self.POLL_INTERVAL, self.poll_file)
+
+    def refresh(self, md_content):
+        """Re-render changed blocks and splice them into the preview"""
+        started = time.perf_counter()
+        start, end, html_blocks = self.renderer.update(md_content)
+
+        text = self.preview_text
+        text.config(state='normal')
+
+        # Each block starts at a mark, so a changed run of blocks can be
+        # replaced without touching the rest of the document
+        end_index = text.index(self.block_marks[end]) if end < len(self.block_marks) else text.index('end-1c')
+        start_index = text.index(self.block_marks[start]) if start < len(self.block_marks) else end_index
+        text.delete(start_index, end_index)
+        for mark in self.block_marks[start:end]:
+            text.mark_unset(mark)
+
+        new_marks = []
+        text.mark_set('splice', start_index)
+        for html in html_blocks:
+            block_start = text.index('splice')
+            for segment, tags in html_to_segments(html):
+                text.insert('splice', segment, tags)
+            self.mark_counter += 1
+            mark = f"block{self.mark_counter}"
+            text.mark_set(mark, block_start)
+            new_marks.append(mark)
+        text.mark_unset('splice')
+        self.block_marks[start:end] = new_marks
+
+        text.config(state='disabled')
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.status_var.set(
+            f"{len(html_blocks)} of {len(self.block_marks)} blocks re-rendered in {elapsed:.0f} ms"
+        )
+
+
 def main():
     """Main entry point for the application"""
     root = tk.Tk()
@@ -0,0 +1,199 @@
+"""
+Incremental markdown preview rendering
+Splits a markdown document into top-level blocks, renders each block on its
+own and caches the result, so an edit only re-renders the blocks it touched
+"""
+import re
+from collections import OrderedDict
+from html.parser import HTMLParser
+from typing import List, Tuple
+
+from converter import MarkdownConverter, update_fence
+
+# Top-level list item marker (indented markers belong to the item above)
+LIST_ITEM_RE = re.compile(r'^([*+-]|\d+[.)])\s+')
+
+# Tags that end a line of preview text
+BLOCK_TAGS = {'p', 'div', 'pre', 'blockquote', 'ul', 'ol', 'li', 'table', 'tr', 'hr',
+              'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+# HTML tags mapped onto the text tags used by the preview widget
+STYLE_TAGS = {
+    'h1': 'h1', 'h2': 'h2', 'h3': 'h3', 'h4': 'h4', 'h5': 'h5', 'h6': 'h6',
+    'strong': 'bold', 'b': 'bold', 'th': 'bold',
+    'em': 'italic', 'i': 'italic',
+    'code': 'code', 'pre': 'pre',
+    'blockquote': 'quote',
+    'a': 'link',
+}
+
+
+def _continues_block(line: str, in_list: bool, last_line: str) -> bool:
+    """Whether a line that follows blank lines still belongs to the current block"""
+    if line[:1] in (' ', '\t'):
+        # List item continuations and indented code both render with what precedes them
+        return True
+    if in_list and LIST_ITEM_RE.match(line):
+        # Next item of a loose list
+        return True
+    return line.startswith('>') and last_line.startswith('>')
+
+
+def split_blocks(md_content: str) -> List[str]:
+    """
+    Split markdown into top-level blocks separated by blank lines
+    Blank lines inside fenced code, list items, indented code and block
+    quotes do not end a block, so each block renders as it does in the book.
+    """
+    blocks = []
+    current = []
+    blank_lines = 0
+    in_list = False
+    fence = None
+
+    for line in md_content.split('\n'):
+        if fence:
+            current.append(line)
+            fence = update_fence(line, fence)
+            continue
+
+        if not line.strip():
+            if current:
+                blank_lines += 1
+            continue
+
+        if blank_lines:
+            if _continues_block(line, in_list, current[-1]):
+                current.extend([''] * blank_lines)
+            else:
+                blocks.append('\n'.join(current))
+                current = []
+                in_list = False
+            blank_lines = 0
+
+        if LIST_ITEM_RE.match(line):
+            in_list = True
+        fence = update_fence(line, fence)
+        current.append(line)
+
+    if current:
+        blocks.append('\n'.join(current))
+
+    return blocks
+
+
+class IncrementalRenderer:
+    """Render markdown to HTML block by block, re-rendering only changed blocks"""
+
+    def __init__(self, cache_size: int = 10000):
+        # Own converter so previews never share markdown state with a running conversion
+        self.converter = MarkdownConverter()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.blocks = []
+        self.html_blocks = []
+
+    def render_block(self, block: str) -> str:
+        """Render a single block, using the cache when possible"""
+        html = self.cache.get(block)
+        if html is not None:
+            self.cache.move_to_end(block)
+            return html
+
+        self.converter.md.reset()
+        html = self.converter.markdown_to_html(block)
+
+        self.cache[block] = html
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return html
+
+    def update(self, md_content: str) -> Tuple[int, int, List[str]]:
+        """
+        Re-render the document after an edit
+        Returns (start, end, html_blocks): the old blocks[start:end] were
+        replaced by the given newly rendered blocks.
+        """
+        old = self.blocks
+        new = split_blocks(md_content)
+
+        # Blocks shared at the start and end of the document are unchanged
+        limit = min(len(old), len(new))
+        start = 0
+        while start < limit and old[start] == new[start]:
+            start += 1
+        suffix = 0
+        while suffix < limit - start and old[-1 - suffix] == new[-1 - suffix]:
+            suffix += 1
+
+        end = len(old) - suffix
+        html_blocks = [self.render_block(block) for block in new[start:len(new) - suffix]]
+
+        self.blocks = new
+        self.html_blocks[start:end] = html_blocks
+
+        return start, end, html_blocks
+
+    def full_html(self) -> str:
+        """Return the HTML of the whole document"""
+        return '\n'.join(self.html_blocks)
+
+
+class _SegmentParser(HTMLParser):
+    """Flatten HTML into (text, tags) segments for a styled text widget"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.segments = []
+        self.open_tags = []
+        self.list_depth = 0
+
+    def _newline(self):
+        if self.segments and not self.segments[-1][0].endswith('\n'):
+            self.segments.append(('\n', ()))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._newline()
+        if tag in ('ul', 'ol'):
+            self.list_depth += 1
+        elif tag == 'li':
+            self.segments.append(('  ' * self.list_depth + '• ', ()))
+        elif tag == 'br':
+            self.segments.append(('\n', ()))
+        elif tag in ('td', 'th') and self.segments and not self.segments[-1][0].endswith('\n'):
+            self.segments.append(('\t', ()))
+        elif tag == 'img':
+            alt = dict(attrs).get('alt') or 'image'
+            self.segments.append((f'[{alt}]', ('link',)))
+
+        if tag in STYLE_TAGS:
+            self.open_tags.append(STYLE_TAGS[tag])
+
+    def handle_endtag(self, tag):
+        if tag in STYLE_TAGS and STYLE_TAGS[tag] in self.open_tags:
+            # Remove the innermost matching style
+            idx = len(self.open_tags) - 1 - self.open_tags[::-1].index(STYLE_TAGS[tag])
+            del self.open_tags[idx]
+        if tag in ('ul', 'ol'):
+            self.list_depth = max(0, self.list_depth - 1)
+        if tag in BLOCK_TAGS:
+            self._newline()
+
+    def handle_data(self, data):
+        if 'pre' not in self.open_tags:
+            data = re.sub(r'\s+', ' ', data)
+            if not self.segments or self.segments[-1][0].endswith('\n'):
+                data = data.lstrip()
+        if data:
+            self.segments.append((data, tuple(self.open_tags)))
+
+
+def html_to_segments(html: str) -> List[Tuple[str, Tuple[str, ...]]]:
+    """Convert rendered HTML into (text, tags) segments ending with a blank line"""
+    parser = _SegmentParser()
+    parser.feed(html)
+    parser.close()
+    parser._newline()
+    parser.segments.append(('\n', ()))
+    return parser.segments
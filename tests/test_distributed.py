@@ -0,0 +1,145 @@
+"""
+Tests for distributed builds, using local worker processes as nodes
+"""
+import multiprocessing
+import os
+import time
+import zipfile
+
+from distributed import BuildDirectory, Coordinator, Worker, _run_worker, build_locally
+from verifier import verify_epub
+
+
+LEASE_TIMEOUT = 1.0
+
+
+def write_chapters(directory, count):
+    paths = []
+    for idx in range(1, count + 1):
+        path = directory / f"ch{idx}.md"
+        path.write_text(f"# Chapter {idx}\n\n## Section {idx}.1\n\nSome text.\n", encoding='utf-8')
+        paths.append(str(path))
+    return paths
+
+
+def start_workers(root, count):
+    processes = [
+        multiprocessing.Process(target=_run_worker, args=(root, f'test-{idx}', LEASE_TIMEOUT))
+        for idx in range(count)
+    ]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def stop_workers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def _claim_and_hang(root, claimed):
+    # Stand-in for a node that takes a job and then dies without finishing it
+    Worker(root, 'doomed', lease_timeout=LEASE_TIMEOUT).claim()
+    claimed.set()
+    time.sleep(60)
+
+
+def test_build_locally_assembles_multi_chapter_book(tmp_path):
+    inputs = write_chapters(tmp_path, 3)
+    output = tmp_path / "out" / "book.epub"
+
+    results = build_locally(
+        [{'input_files': inputs, 'output_file': str(output), 'title': "Test Book"}],
+        str(tmp_path / "build"),
+        workers=2,
+        lease_timeout=LEASE_TIMEOUT,
+        timeout=30,
+    )
+
+    (result,) = results.values()
+    assert result['status'] == 'success'
+    assert output.exists()
+    assert verify_epub(str(output)) == []
+    names = zipfile.ZipFile(output).namelist()
+    assert [n for n in names if n.startswith('EPUB/chapter_')] == [
+        'EPUB/chapter_1.xhtml', 'EPUB/chapter_2.xhtml', 'EPUB/chapter_3.xhtml'
+    ]
+
+
+def test_job_of_killed_worker_is_requeued_and_completed(tmp_path):
+    root = str(tmp_path / "build")
+    inputs = write_chapters(tmp_path, 3)
+    coordinator = Coordinator(root, lease_timeout=LEASE_TIMEOUT)
+    book_id = coordinator.submit(inputs, str(tmp_path / "book.epub"))
+
+    claimed = multiprocessing.Event()
+    doomed = multiprocessing.Process(target=_claim_and_hang, args=(root, claimed))
+    doomed.start()
+    assert claimed.wait(10)
+    doomed.kill()
+    doomed.join()
+
+    build_dir = BuildDirectory(root)
+    (claim,) = build_dir.claims()
+    assert claim.name.endswith('@doomed.json')
+
+    time.sleep(LEASE_TIMEOUT * 1.5)
+    assert build_dir.reap_expired(LEASE_TIMEOUT) == 1
+    assert build_dir.claims() == []
+
+    processes = start_workers(root, 2)
+    try:
+        result = coordinator.wait([book_id], timeout=30)[book_id]
+    finally:
+        stop_workers(processes)
+
+    assert result['status'] == 'success'
+    assert os.listdir(build_dir.failed_dir) == []
+
+
+def test_publish_failure_fails_book_instead_of_hanging(tmp_path):
+    root = str(tmp_path / "build")
+    inputs = write_chapters(tmp_path, 2)
+    # A directory in the way makes writing the output file fail on every attempt
+    blocked = tmp_path / "book.epub"
+    blocked.mkdir()
+
+    coordinator = Coordinator(root, lease_timeout=LEASE_TIMEOUT)
+    book_id = coordinator.submit(inputs, str(blocked))
+
+    processes = start_workers(root, 2)
+    try:
+        result = coordinator.wait([book_id], timeout=30)[book_id]
+    finally:
+        stop_workers(processes)
+
+    assert result['status'] == 'failed'
+    assert 'assemble' in result['error']
+
+
+def test_submit_creates_missing_output_directory(tmp_path):
+    inputs = write_chapters(tmp_path, 1)
+    output = tmp_path / "missing" / "nested" / "book.epub"
+
+    results = build_locally(
+        [{'input_files': inputs, 'output_file': str(output)}],
+        str(tmp_path / "build"),
+        workers=1,
+        lease_timeout=LEASE_TIMEOUT,
+        timeout=30,
+    )
+
+    assert list(results.values())[0]['status'] == 'success'
+    assert output.exists()
+
+
+def test_late_failure_does_not_overwrite_published_book(tmp_path):
+    build_dir = BuildDirectory(str(tmp_path / "build"))
+
+    assert build_dir.record_result('book', {'status': 'success', 'digest': 'abc'})
+    build_dir.fail_book('book', {'id': 'book-0', 'last_error': "out of attempts"})
+
+    assert build_dir.book_result('book') == {'status': 'success', 'digest': 'abc'}
+    assert [p.name for p in build_dir.books_dir.iterdir()] == ['book.result.json']
@@ -0,0 +1,43 @@
+"""
+Tests for incremental preview rendering
+"""
+import re
+
+import pytest
+
+from converter import MarkdownConverter
+from preview import IncrementalRenderer, split_blocks
+
+
+def normalize(html):
+    # Heading IDs come from the toc extension's per-document counters
+    return re.sub(r'\s+', '', re.sub(r' id="[^"]*"', '', html))
+
+
+@pytest.mark.parametrize('md_content', [
+    "- item\n\n    continued\n\nAfter the list",
+    "    code one\n\n    code two\n\nAfter the code",
+    "> first\n\n> second\n\nAfter the quote",
+    "1. one\n\n2. two\n\n# Heading\n\n- a\n\n- b",
+    "Text\n\n```python\n# comment\n\nx = 1\n```\n\nMore text",
+])
+def test_blocks_render_like_the_whole_document(md_content):
+    renderer = IncrementalRenderer()
+    renderer.update(md_content)
+
+    assert normalize(renderer.full_html()) == normalize(MarkdownConverter().markdown_to_html(md_content))
+
+
+def test_list_continuation_stays_in_one_block():
+    assert split_blocks("- item\n\n    continued\n\nPara") == ["- item\n\n    continued", "Para"]
+
+
+def test_update_rerenders_only_changed_block():
+    renderer = IncrementalRenderer()
+    renderer.update("# Title\n\nFirst\n\nSecond\n\nThird")
+
+    start, end, html_blocks = renderer.update("# Title\n\nFirst\n\nSecond edited\n\nThird")
+
+    assert (start, end) == (2, 3)
+    assert len(html_blocks) == 1
+    assert 'Second edited' in html_blocks[0]
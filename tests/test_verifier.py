@@ -0,0 +1,97 @@
+"""
+Tests for post-build EPUB verification
+"""
+import multiprocessing
+import os
+import re
+
+import pytest
+
+from converter import MarkdownConverter
+from verifier import PARALLEL_THRESHOLD, EpubVerificationError, verify_epub
+
+
+def write_book(tmp_path, chapter_count):
+    inputs = []
+    for idx in range(1, chapter_count + 1):
+        path = tmp_path / f"ch{idx}.md"
+        path.write_text(f"# Chapter {idx}\n\n## Section\n\nText.\n", encoding='utf-8')
+        inputs.append(str(path))
+    output = str(tmp_path / "book.epub")
+    MarkdownConverter().convert_multiple_files(inputs, output, verify=False)
+    return output
+
+
+def _verify_in_child(epub_file, results):
+    try:
+        results.put(verify_epub(epub_file, workers=4))
+    except Exception as e:
+        results.put(repr(e))
+
+
+def test_converted_book_passes(tmp_path):
+    assert verify_epub(write_book(tmp_path, 3)) == []
+
+
+def test_large_book_verifies_inside_daemon_process(tmp_path):
+    # Distributed build workers are daemonic and may not start a process pool
+    output = write_book(tmp_path, PARALLEL_THRESHOLD + 6)
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(target=_verify_in_child, args=(output, results), daemon=True)
+    child.start()
+
+    assert results.get(timeout=60) == []
+    child.join()
+
+
+def test_large_book_verifies_in_parallel(tmp_path):
+    assert verify_epub(write_book(tmp_path, PARALLEL_THRESHOLD + 6), workers=2) == []
+
+
+def test_invalid_book_raises_verification_error_and_keeps_existing_output(tmp_path):
+    source = tmp_path / "dup.md"
+    source.write_text('# Title\n\n<p id="same">a</p>\n\n<p id="same">b</p>\n', encoding='utf-8')
+    output = tmp_path / "dup.epub"
+    output.write_bytes(b"earlier build")
+
+    with pytest.raises(EpubVerificationError) as excinfo:
+        MarkdownConverter().convert_single_file(str(source), str(output))
+
+    assert any("duplicate id 'same'" in problem for problem in excinfo.value.problems)
+    assert output.read_bytes() == b"earlier build"
+    assert sorted(os.listdir(tmp_path)) == ["dup.epub", "dup.md"]
+
+
+def test_broken_chapter_links_are_warnings(tmp_path):
+    source = tmp_path / "image.md"
+    source.write_text("# T\n\n![pic](images/a.png)\n\nSee [intro](#t)\n", encoding='utf-8')
+    output = tmp_path / "image.epub"
+
+    converter = MarkdownConverter()
+    assert converter.convert_single_file(str(source), str(output))
+
+    assert output.exists()
+    assert verify_epub(str(output)) == []
+    warnings = converter.verification_warnings
+    assert any("link to missing file EPUB/images/a.png" in warning for warning in warnings)
+    assert any("dangling anchor" in warning and warning.endswith("#t") for warning in warnings)
+
+    converter.strict_links = True
+    with pytest.raises(EpubVerificationError):
+        converter.convert_single_file(str(source), str(output))
+    assert len(verify_epub(str(output), strict=True)) == 2
+
+
+@pytest.mark.parametrize("md_content, expected", [
+    ("# Real\n\n```bash\n# comment\n```\n\n## Also real\n", ["Real", "Also real"]),
+    # "```python" opens a fence but never closes one
+    ("```\ncode\n```python\n# c\n```\n\n# Real", ["Real"]),
+    # Indented fences are not fences, so both headings render
+    ("  ```\n# X\n  ```\n\n# Real", ["X", "Real"]),
+])
+def test_headings_inside_fenced_code_are_ignored(md_content, expected):
+    converter = MarkdownConverter()
+    headings = converter.extract_headings(md_content)
+
+    assert [h.text for h in headings] == expected
+    assert len(re.findall(r'<h[1-6]', converter.markdown_to_html(md_content))) == len(expected)
@@ -0,0 +1,289 @@
+"""
+Post-build verification for generated EPUB files
+Checks chapter XHTML well-formedness, duplicate IDs, manifest/spine/nav
+consistency and dangling internal links, reading straight from the written zip.
+Broken links inside chapters are reported as warnings rather than problems.
+"""
+import multiprocessing
+import os
+import posixpath
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlsplit
+
+from lxml import etree
+
+
+NAMESPACES = {
+    'container': 'urn:oasis:names:tc:opendocument:xmlns:container',
+    'opf': 'http://www.idpf.org/2007/opf',
+    'ncx': 'http://www.daisy.org/z3986/2005/ncx/',
+}
+
+XHTML_MEDIA_TYPE = 'application/xhtml+xml'
+
+# Below this many documents, starting worker processes costs more than it saves
+PARALLEL_THRESHOLD = 64
+
+# Attributes that point at other documents in the book
+LINK_ATTRIBUTES = ('href', 'src')
+
+
+class EpubVerificationError(Exception):
+    """Raised when a written EPUB fails verification"""
+
+    def __init__(self, epub_file: str, problems: List[str]):
+        self.epub_file = epub_file
+        self.problems = problems
+        shown = '\n'.join(f"  - {problem}" for problem in problems[:20])
+        more = f"\n  ... and {len(problems) - 20} more" if len(problems) > 20 else ''
+        super().__init__(f"{epub_file} failed verification:\n{shown}{more}")
+
+
+def _parser() -> etree.XMLParser:
+    # Never fetch DTDs or expand external entities from book content
+    return etree.XMLParser(resolve_entities=False, no_network=True, load_dtd=False)
+
+
+def _resolve(base_name: str, target: str) -> Tuple[str, str]:
+    """
+    Resolve a link relative to the zip member containing it
+    Returns (member path, fragment); member path is '' for external links
+    """
+    parts = urlsplit(target)
+    if parts.scheme or parts.netloc:
+        return '', ''
+    if not parts.path:
+        return base_name, unquote(parts.fragment)
+    path = posixpath.normpath(posixpath.join(posixpath.dirname(base_name), unquote(parts.path)))
+    return path, unquote(parts.fragment)
+
+
+def check_document(name: str, data: bytes) -> Tuple[List[str], Optional[Set[str]], List[Tuple[str, str]]]:
+    """
+    Check a single XHTML document
+    Returns (problems, ids, links) where links are resolved (path, fragment)
+    pairs; ids is None when the document could not be parsed at all
+    """
+    try:
+        root = etree.fromstring(data, _parser())
+    except etree.XMLSyntaxError as e:
+        return [f"{name}: not well-formed XHTML: {e}"], None, []
+
+    problems = []
+    ids = set()
+    links = []
+
+    for element in root.iter():
+        if not isinstance(element.tag, str):
+            # Comments and processing instructions
+            continue
+
+        element_id = element.get('id')
+        if element_id is not None:
+            if element_id in ids:
+                problems.append(f"{name}: duplicate id '{element_id}'")
+            ids.add(element_id)
+
+        for attribute in LINK_ATTRIBUTES:
+            target = element.get(attribute)
+            if target:
+                path, fragment = _resolve(name, target)
+                if path:
+                    links.append((path, fragment))
+
+    return problems, ids, links
+
+
+def _check_members(epub_file: str, names: List[str]) -> List[Tuple[str, List[str], Optional[Set[str]], List[Tuple[str, str]]]]:
+    """Check a batch of documents, reading them straight from the zip"""
+    results = []
+    with zipfile.ZipFile(epub_file) as book_zip:
+        for name in names:
+            results.append((name, *check_document(name, book_zip.read(name))))
+    return results
+
+
+def _check_all_documents(epub_file: str, names: List[str], workers: int = None) -> List:
+    """Check every document, spreading large books over several processes"""
+    workers = workers or os.cpu_count() or 1
+    # Daemonic processes (such as distributed build workers) may not start children
+    if len(names) < PARALLEL_THRESHOLD or workers == 1 or multiprocessing.current_process().daemon:
+        return _check_members(epub_file, names)
+
+    # A few batches per worker keeps them busy when chapter sizes vary
+    batch_count = workers * 4
+    batches = [names[i::batch_count] for i in range(batch_count) if names[i::batch_count]]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for batch_results in executor.map(_check_members, [epub_file] * len(batches), batches):
+            results.extend(batch_results)
+    return results
+
+
+def _read_package(book_zip: zipfile.ZipFile, problems: List[str]) -> Tuple[str, Dict[str, Dict], List[str], str]:
+    """
+    Locate and parse the OPF package document
+    Returns (opf path, manifest {id: item}, spine idrefs, spine toc id)
+    """
+    try:
+        container = etree.fromstring(book_zip.read('META-INF/container.xml'), _parser())
+    except KeyError:
+        problems.append("META-INF/container.xml is missing")
+        return '', {}, [], ''
+    except etree.XMLSyntaxError as e:
+        problems.append(f"META-INF/container.xml: not well-formed: {e}")
+        return '', {}, [], ''
+
+    rootfile = container.find('.//container:rootfile', NAMESPACES)
+    opf_path = rootfile.get('full-path') if rootfile is not None else None
+    if not opf_path:
+        problems.append("META-INF/container.xml does not name a package document")
+        return '', {}, [], ''
+
+    try:
+        package = etree.fromstring(book_zip.read(opf_path), _parser())
+    except KeyError:
+        problems.append(f"package document {opf_path} is missing")
+        return '', {}, [], ''
+    except etree.XMLSyntaxError as e:
+        problems.append(f"{opf_path}: not well-formed: {e}")
+        return '', {}, [], ''
+
+    manifest = {}
+    for item in package.iterfind('opf:manifest/opf:item', NAMESPACES):
+        item_id = item.get('id')
+        if item_id in manifest:
+            problems.append(f"{opf_path}: duplicate manifest id '{item_id}'")
+        manifest[item_id] = {
+            'path': _resolve(opf_path, item.get('href', ''))[0],
+            'media_type': item.get('media-type', ''),
+            'properties': (item.get('properties') or '').split(),
+        }
+
+    spine = package.find('opf:spine', NAMESPACES)
+    if spine is None:
+        problems.append(f"{opf_path}: no spine")
+        return opf_path, manifest, [], ''
+    idrefs = [itemref.get('idref') for itemref in spine.iterfind('opf:itemref', NAMESPACES)]
+
+    return opf_path, manifest, idrefs, spine.get('toc', '')
+
+
+def _check_ncx(name: str, data: bytes) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """Check the NCX table of contents and collect its links"""
+    try:
+        ncx = etree.fromstring(data, _parser())
+    except etree.XMLSyntaxError as e:
+        return [f"{name}: not well-formed: {e}"], []
+
+    problems = []
+    links = []
+    for content in ncx.iterfind('.//ncx:content', NAMESPACES):
+        src = content.get('src')
+        if not src:
+            problems.append(f"{name}: navigation entry with empty src")
+            continue
+        path, fragment = _resolve(name, src)
+        if path:
+            links.append((path, fragment))
+    return problems, links
+
+
+def check_epub(epub_file: str, workers: int = None) -> Tuple[List[str], List[str]]:
+    """
+    Check a written EPUB file
+    Returns (problems, warnings). Problems make the book structurally invalid;
+    warnings are chapter links to files or anchors the book does not contain,
+    such as images that were never embedded.
+    """
+    problems = []
+    warnings = []
+
+    try:
+        book_zip = zipfile.ZipFile(epub_file)
+    except (OSError, zipfile.BadZipFile) as e:
+        return [f"cannot open {epub_file}: {e}"], warnings
+
+    with book_zip:
+        names = book_zip.namelist()
+        if not names or names[0] != 'mimetype':
+            problems.append("mimetype is not the first entry in the archive")
+        elif book_zip.read('mimetype') != b'application/epub+zip':
+            problems.append("mimetype does not contain 'application/epub+zip'")
+
+        opf_path, manifest, idrefs, toc_id = _read_package(book_zip, problems)
+        if not opf_path:
+            return problems, warnings
+
+        # Manifest <-> archive consistency
+        members = set(names)
+        manifest_paths = {item['path'] for item in manifest.values()}
+        for item_id, item in manifest.items():
+            if item['path'] not in members:
+                problems.append(f"manifest item '{item_id}' points to missing file {item['path']}")
+        for name in names:
+            if name in ('mimetype', opf_path) or name.startswith('META-INF/') or name.endswith('/'):
+                continue
+            if name not in manifest_paths:
+                problems.append(f"{name} is not listed in the manifest")
+
+        # Spine and navigation documents
+        if not idrefs:
+            problems.append("spine is empty")
+        for idref in idrefs:
+            if idref not in manifest:
+                problems.append(f"spine references unknown manifest id '{idref}'")
+            elif manifest[idref]['media_type'] != XHTML_MEDIA_TYPE:
+                problems.append(f"spine item '{idref}' is not an XHTML document")
+
+        nav_paths = {item['path'] for item in manifest.values() if 'nav' in item['properties']}
+        if not nav_paths:
+            problems.append("manifest has no navigation document (properties=\"nav\")")
+
+        link_sources = []
+        if toc_id:
+            if toc_id not in manifest:
+                problems.append(f"spine toc references unknown manifest id '{toc_id}'")
+            elif manifest[toc_id]['path'] in members:
+                ncx_path = manifest[toc_id]['path']
+                ncx_problems, ncx_links = _check_ncx(ncx_path, book_zip.read(ncx_path))
+                problems.extend(ncx_problems)
+                nav_paths.add(ncx_path)
+                link_sources.append((ncx_path, ncx_links))
+
+    documents = sorted(
+        item['path'] for item in manifest.values()
+        if item['media_type'] == XHTML_MEDIA_TYPE and item['path'] in members
+    )
+
+    ids_by_document = {}
+    for name, doc_problems, ids, links in _check_all_documents(epub_file, documents, workers):
+        problems.extend(doc_problems)
+        ids_by_document[name] = ids
+        link_sources.append((name, links))
+
+    # Every internal link should point at a manifest item and an existing anchor.
+    # A broken navigation entry breaks the book; a broken link in a chapter
+    # only breaks that link.
+    for source, links in link_sources:
+        findings = problems if source in nav_paths else warnings
+        for path, fragment in links:
+            if path not in manifest_paths:
+                findings.append(f"{source}: link to missing file {path}")
+            elif fragment and ids_by_document.get(path) is not None and fragment not in ids_by_document[path]:
+                findings.append(f"{source}: dangling anchor {path}#{fragment}")
+
+    return problems, warnings
+
+
+def verify_epub(epub_file: str, workers: int = None, strict: bool = False) -> List[str]:
+    """
+    Verify a written EPUB file
+    Returns a list of problems; an empty list means the book passed.
+    With strict, broken chapter links count as problems too.
+    """
+    problems, warnings = check_epub(epub_file, workers)
+    return problems + warnings if strict else problems